@@ -4,15 +4,74 @@ Flaskで静的ファイルとダッシュボードHTMLを配信する。
 """
 
 import os
-import json
+import re
+import sys
+import math
+import time
+import threading
 from pathlib import Path
-from datetime import datetime
+from datetime import date, datetime
 
-from flask import Flask, render_template, send_from_directory, jsonify
+from flask import Flask, Response, abort, render_template, request, send_from_directory, jsonify
+
+import cycle_journal
+import screenshot_archive
+from screenshot_cache import CachedFile, ScreenshotCache
 
 app = Flask(__name__)
 
 SCREENSHOT_DIR = Path(__file__).parent / "screenshots"
+PRICE_DATA_FILE = SCREENSHOT_DIR / "price_data.json"
+
+# 本番モード (--prod) のワーカースレッド数
+PROD_THREADS = 32
+
+# タイムラプス配信のフレームレート範囲
+TIMELAPSE_MIN_FPS = 1
+TIMELAPSE_MAX_FPS = 10
+# 1ストリームの最長再生時間 (秒) ─ 超える分はフレームを間引く
+TIMELAPSE_MAX_SEC = 60
+# 同時に配信するタイムラプスの上限 (ダッシュボード用のスレッドを使い切らないため)
+TIMELAPSE_MAX_STREAMS = 4
+_timelapse_slots = threading.BoundedSemaphore(TIMELAPSE_MAX_STREAMS)
+
+ARCHIVE_DIGEST_RE = re.compile(r"[0-9a-f]{40}")
+
+# 配信用インメモリキャッシュ (スクレイパーの公開時のみディスクを読み直す)
+cache = ScreenshotCache(SCREENSHOT_DIR)
+
+
+@app.before_request
+def refresh_cache():
+    cache.refresh_if_published()
+
+
+def cached_response(entry: CachedFile) -> Response:
+    """キャッシュ済みファイルを条件付き・圧縮対応で返す"""
+    if request.if_none_match.contains(entry.etag):
+        response = Response(status=304)
+    elif entry.gzip_data is not None and "gzip" in request.accept_encodings:
+        response = Response(entry.gzip_data, mimetype=entry.mimetype)
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(entry.data, mimetype=entry.mimetype)
+
+    response.set_etag(entry.etag)
+    response.last_modified = entry.mtime
+    if entry.gzip_data is not None:
+        response.vary.add("Accept-Encoding")
+    # ハッシュ付きURL (?v=) は内容が変わらないので長期キャッシュさせる
+    if request.args.get("v") == entry.etag:
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def format_last_updated(mtime: float) -> str:
+    if mtime > 0:
+        return datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S")
+    return "未取得"
 
 
 @app.route("/")
@@ -26,41 +85,164 @@ def dashboard():
 @app.route("/screenshots/<path:filename>")
 def serve_screenshot(filename):
     """スクリーンショット画像を配信"""
+    entry = cache.get(filename)
+    if entry is not None:
+        return cached_response(entry)
     return send_from_directory(str(SCREENSHOT_DIR), filename)
 
 
 @app.route("/api/status")
 def api_status():
     """最終更新時刻を返すAPI"""
-    latest_mtime = 0
-    if SCREENSHOT_DIR.exists():
-        for f in SCREENSHOT_DIR.glob("*.png"):
-            mtime = f.stat().st_mtime
-            if mtime > latest_mtime:
-                latest_mtime = mtime
-
-    if latest_mtime > 0:
-        last_updated = datetime.fromtimestamp(latest_mtime).strftime("%Y-%m-%d %H:%M:%S")
-    else:
-        last_updated = "未取得"
-
     return jsonify({
-        "last_updated": last_updated,
-        "screenshot_count": len(list(SCREENSHOT_DIR.glob("*.png"))) if SCREENSHOT_DIR.exists() else 0,
+        "last_updated": format_last_updated(cache.latest_png_mtime()),
+        "screenshot_count": sum(1 for name in cache.entries() if name.endswith(".png")),
     })
 
 
 @app.route("/api/prices")
 def api_prices():
     """値動きデータを返すAPI"""
-    price_file = SCREENSHOT_DIR / "price_data.json"
-    if price_file.exists():
-        with open(price_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return jsonify(data)
+    entry = cache.get(PRICE_DATA_FILE.name)
+    if entry is not None:
+        return cached_response(entry)
     return jsonify({})
 
 
+@app.route("/api/manifest")
+def api_manifest():
+    """各チャート画像と値動きデータのハッシュ一覧を返すAPI
+
+    ダッシュボードはこれをポーリングし、ハッシュが変わったカードだけを再読み込みする。
+    """
+    from scraper import SECTORS
+
+    images = {}
+    latest_mtime = 0
+    for qcode in SECTORS:
+        for mode in ("intraday", "daily"):
+            entry = cache.get(f"{qcode}_{mode}.png")
+            if entry is None:
+                continue
+            images[f"{qcode}_{mode}"] = entry.etag
+            latest_mtime = max(latest_mtime, entry.mtime)
+
+    prices = cache.get(PRICE_DATA_FILE.name)
+    response = jsonify({
+        "last_updated": format_last_updated(latest_mtime),
+        "prices": prices.etag if prices else None,
+        "images": images,
+    })
+    # 全クライアントがポーリングするので、変化がなければ 304 で返す
+    response.add_etag()
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+def archive_frames(qcode: str) -> tuple[str, list[dict]]:
+    """クエリ (mode, date) に対応するタイムラインのキーとフレーム一覧を返す"""
+    from scraper import SECTORS
+
+    if qcode not in SECTORS:
+        abort(404)
+    mode = request.args.get("mode", "intraday")
+    if mode not in ("intraday", "daily"):
+        abort(400)
+    try:
+        day = date.fromisoformat(request.args.get("date", date.today().isoformat()))
+    except ValueError:
+        abort(400)
+    key = f"{qcode}_{mode}"
+    return key, screenshot_archive.frames_for_date(key, day)
+
+
+@app.route("/api/timeline/<qcode>")
+def api_timeline(qcode):
+    """指定業種・日付のアーカイブ済みフレーム一覧を返すAPI"""
+    key, frames = archive_frames(qcode)
+    return jsonify({"key": key, "frames": frames})
+
+
+@app.route("/archive/<digest>.png")
+def serve_archive(digest):
+    """アーカイブ済み画像を配信 (内容が変わらないので長期キャッシュ可)"""
+    if not ARCHIVE_DIGEST_RE.fullmatch(digest):
+        abort(404)
+    path = screenshot_archive.object_path(digest)
+    if not path.exists():
+        abort(404)
+    response = send_from_directory(str(path.parent), path.name)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+@app.route("/api/timelapse/<qcode>")
+def api_timelapse(qcode):
+    """指定業種・日付のチャートをタイムラプスとしてストリーミング配信する
+
+    multipart/x-mixed-replace で1フレームずつ送るので、<img> にそのまま指定できる。
+    配信中はワーカースレッドを占有するため、同時配信数と再生時間に上限を設けている。
+    """
+    _, frames = archive_frames(qcode)
+    if not frames:
+        abort(404)
+    try:
+        fps = float(request.args.get("fps", 2))
+    except ValueError:
+        abort(400)
+    if not math.isfinite(fps):
+        abort(400)
+    fps = min(max(fps, TIMELAPSE_MIN_FPS), TIMELAPSE_MAX_FPS)
+
+    # 最長再生時間に収まるようにフレームを間引く (最後のフレームは残す)
+    max_frames = int(fps * TIMELAPSE_MAX_SEC)
+    if len(frames) > max_frames:
+        step = math.ceil(len(frames) / max_frames)
+        frames = frames[:-1][::step] + frames[-1:]
+
+    if not _timelapse_slots.acquire(blocking=False):
+        abort(503)
+
+    def generate():
+        for i, frame in enumerate(frames):
+            path = screenshot_archive.object_path(frame["hash"])
+            if not path.exists():
+                continue
+            if i > 0:
+                time.sleep(1 / fps)
+            data = path.read_bytes()
+            yield (
+                b"--frame\r\nContent-Type: image/png\r\n"
+                + f"Content-Length: {len(data)}\r\nX-Timestamp: {frame['ts']}\r\n\r\n".encode()
+                + data
+                + b"\r\n"
+            )
+
+    response = Response(generate(), mimetype="multipart/x-mixed-replace; boundary=frame")
+    # サーバーがレスポンスを閉じたとき (切断時を含む) に枠を返す
+    response.call_on_close(_timelapse_slots.release)
+    return response
+
+
+@app.route("/api/journal/summary")
+def api_journal_summary():
+    """日別の取得成功率・レイテンシ集計を返すAPI"""
+    days = request.args.get("days", 30, type=int)
+    return jsonify({"days": cycle_journal.summarize_by_day(max(1, min(days, 365)))})
+
+
+@app.route("/api/journal/cycles")
+def api_journal_cycles():
+    """直近のサイクル実行記録を業種別の結果付きで返すAPI"""
+    limit = request.args.get("limit", 20, type=int)
+    return jsonify({"cycles": cycle_journal.recent_cycles(max(1, min(limit, 500)))})
+
+
 if __name__ == "__main__":
     SCREENSHOT_DIR.mkdir(exist_ok=True)
-    app.run(host="0.0.0.0", port=5001, debug=False)
+    if "--prod" in sys.argv:
+        # 本番モード: マルチスレッドのWSGIサーバーで配信
+        from waitress import serve
+        serve(app, host="0.0.0.0", port=5001, threads=PROD_THREADS)
+    else:
+        app.run(host="0.0.0.0", port=5001, debug=False)
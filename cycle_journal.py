@@ -0,0 +1,177 @@
+"""
+TOPIX-17業種 ETFチャート監視モニター - サイクル実行記録
+スクレイパーの1サイクルごとの結果 (業種別の成否・所要時間・使用セレクタ・リトライ回数) を
+SQLite に記録し、日別の成功率・レイテンシ集計を提供する。
+"""
+
+import datetime
+import sqlite3
+from dataclasses import dataclass, field
+from pathlib import Path
+
+JOURNAL_DB = Path(__file__).parent / "journal.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cycles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at TEXT NOT NULL,
+    ended_at TEXT NOT NULL,
+    duration REAL NOT NULL,
+    success INTEGER NOT NULL,
+    total INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sector_runs (
+    cycle_id INTEGER NOT NULL REFERENCES cycles(id),
+    qcode TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    ok INTEGER NOT NULL,
+    latency REAL,
+    retries INTEGER NOT NULL,
+    daily_selector TEXT,
+    intraday_selector TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_cycles_started_at ON cycles(started_at);
+CREATE INDEX IF NOT EXISTS idx_sector_runs_cycle_id ON sector_runs(cycle_id);
+"""
+
+
+def now_iso() -> str:
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+@dataclass
+class SectorRun:
+    """1業種分の取得結果"""
+    qcode: str
+    started_at: str = field(default_factory=now_iso)
+    ok: bool = False
+    latency: float | None = None
+    retries: int = 0
+    daily_selector: str | None = None
+    intraday_selector: str | None = None
+    error: str | None = None
+
+
+@dataclass
+class CycleRecord:
+    """1サイクル分の取得結果"""
+    started_at: str = field(default_factory=now_iso)
+    ended_at: str | None = None
+    duration: float = 0.0
+    sectors: list[SectorRun] = field(default_factory=list)
+
+
+def connect(path: Path = JOURNAL_DB) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def write_cycle(record: CycleRecord, path: Path = JOURNAL_DB):
+    """1サイクル分の記録を1トランザクションで書き込む"""
+    conn = connect(path)
+    try:
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO cycles (started_at, ended_at, duration, success, total) VALUES (?, ?, ?, ?, ?)",
+                (
+                    record.started_at,
+                    record.ended_at or now_iso(),
+                    record.duration,
+                    sum(1 for s in record.sectors if s.ok),
+                    len(record.sectors),
+                ),
+            )
+            conn.executemany(
+                "INSERT INTO sector_runs (cycle_id, qcode, started_at, ok, latency, retries,"
+                " daily_selector, intraday_selector, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        cur.lastrowid, s.qcode, s.started_at, int(s.ok), s.latency, s.retries,
+                        s.daily_selector, s.intraday_selector, s.error,
+                    )
+                    for s in record.sectors
+                ],
+            )
+    finally:
+        conn.close()
+
+
+def _percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def summarize_by_day(days: int = 30, path: Path = JOURNAL_DB) -> list[dict]:
+    """直近 days 日分の日別集計 (新しい順) を返す"""
+    if not path.exists():
+        return []
+    since = (datetime.date.today() - datetime.timedelta(days=days - 1)).isoformat()
+    conn = connect(path)
+    try:
+        cycles = conn.execute(
+            "SELECT substr(started_at, 1, 10) AS day, COUNT(*) AS cycles, AVG(duration) AS avg_duration"
+            " FROM cycles WHERE started_at >= ? GROUP BY day",
+            (since,),
+        ).fetchall()
+        runs = conn.execute(
+            "SELECT substr(c.started_at, 1, 10) AS day, s.ok, s.latency, s.retries"
+            " FROM sector_runs s JOIN cycles c ON c.id = s.cycle_id WHERE c.started_at >= ?",
+            (since,),
+        ).fetchall()
+    finally:
+        conn.close()
+
+    summary = {
+        row["day"]: {
+            "day": row["day"],
+            "cycles": row["cycles"],
+            "avg_cycle_sec": round(row["avg_duration"], 1),
+            "attempts": 0,
+            "successes": 0,
+            "retries": 0,
+            "latencies": [],
+        }
+        for row in cycles
+    }
+    for row in runs:
+        day = summary[row["day"]]
+        day["attempts"] += 1
+        day["successes"] += row["ok"]
+        day["retries"] += row["retries"]
+        if row["ok"] and row["latency"] is not None:
+            day["latencies"].append(row["latency"])
+
+    result = []
+    for day in sorted(summary.values(), key=lambda d: d["day"], reverse=True):
+        latencies = day.pop("latencies")
+        day["success_rate"] = round(day["successes"] / day["attempts"], 4) if day["attempts"] else None
+        day["latency_avg_sec"] = round(sum(latencies) / len(latencies), 2) if latencies else None
+        p95 = _percentile(latencies, 0.95)
+        day["latency_p95_sec"] = round(p95, 2) if p95 is not None else None
+        result.append(day)
+    return result
+
+
+def recent_cycles(limit: int = 20, path: Path = JOURNAL_DB) -> list[dict]:
+    """直近 limit 件のサイクルを業種別の結果付きで返す (新しい順)"""
+    if not path.exists():
+        return []
+    conn = connect(path)
+    try:
+        cycles = [dict(row) for row in conn.execute(
+            "SELECT * FROM cycles ORDER BY id DESC LIMIT ?", (limit,)
+        )]
+        for cycle in cycles:
+            cycle["sectors"] = [dict(row) for row in conn.execute(
+                "SELECT qcode, started_at, ok, latency, retries, daily_selector, intraday_selector, error"
+                " FROM sector_runs WHERE cycle_id = ? ORDER BY rowid",
+                (cycle["id"],),
+            )]
+    finally:
+        conn.close()
+    return cycles
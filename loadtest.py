@@ -0,0 +1,105 @@
+"""
+TOPIX-17業種 ETFチャート監視モニター - 負荷テスト
+ローカルのWebサーバーに対して、ダッシュボードと同じアクセスパターン
+(マニフェスト取得 → 条件付きで全チャート画像を取得) を多数のクライアントで再現する。
+
+使用方法:
+    python app.py --prod &
+    python loadtest.py --clients 200 --duration 30
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+
+
+def client_loop(base_url: str, deadline: float, latencies: list, statuses: Counter, lock: threading.Lock):
+    """1クライアント分のアクセスを締め切りまで繰り返す"""
+    etags: dict[str, str] = {}
+
+    def fetch(path: str) -> bytes:
+        req = urllib.request.Request(base_url + path, headers={"Accept-Encoding": "gzip"})
+        if path in etags:
+            req.add_header("If-None-Match", etags[path])
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=10) as res:
+                body = res.read()
+                status = res.status
+                etag = res.headers.get("ETag")
+        except urllib.error.HTTPError as e:
+            body = b""
+            status = e.code
+            etag = None
+        except OSError:
+            body = b""
+            status = "error"
+            etag = None
+        elapsed = time.perf_counter() - start
+        if etag:
+            etags[path] = etag
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] += 1
+        return body
+
+    while time.time() < deadline:
+        body = fetch("/api/manifest")
+        try:
+            images = json.loads(body).get("images", {})
+        except ValueError:
+            images = {}
+        for key in images:
+            fetch(f"/screenshots/{key}.png")
+        fetch("/api/prices")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ダッシュボード配信の負荷テスト")
+    parser.add_argument("--url", default="http://127.0.0.1:5001", help="対象サーバーのURL")
+    parser.add_argument("--clients", type=int, default=100, help="同時クライアント数")
+    parser.add_argument("--duration", type=float, default=30.0, help="実行時間 (秒)")
+    args = parser.parse_args()
+
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    lock = threading.Lock()
+    deadline = time.time() + args.duration
+
+    threads = [
+        threading.Thread(
+            target=client_loop,
+            args=(args.url.rstrip("/"), deadline, latencies, statuses, lock),
+            daemon=True,
+        )
+        for _ in range(args.clients)
+    ]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+
+    if not latencies:
+        print("リクエストが1件も完了しませんでした")
+        return
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+    print(f"クライアント数: {args.clients} / 実行時間: {elapsed:.1f}秒")
+    print(f"リクエスト数: {len(latencies)} ({len(latencies) / elapsed:.0f} req/s)")
+    print(f"ステータス: {dict(statuses)}")
+    print(
+        f"レイテンシ (ms): 中央値 {statistics.median(latencies) * 1000:.1f} / "
+        f"p95 {p95 * 1000:.1f} / 最大 {latencies[-1] * 1000:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
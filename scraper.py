@@ -5,24 +5,32 @@ Playwrightでスクリーンショット撮影し、ローカルに保存する
 """
 
 import asyncio
+import contextlib
 import random
 import json
 import os
 import sys
 import time
+import queue
 import logging
 import datetime
 import jpholiday
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 from playwright.async_api import async_playwright
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
+import cycle_journal
+import screenshot_archive
+import screenshot_cache
+
 logger = logging.getLogger(__name__)
 
+# ログファイル (サイズでローテーション)
+LOG_FILE = Path(__file__).parent / "scraper.log"
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
 # ── TOPIX-17業種 ETFコード → 業種名 マッピング ──────────────
 SECTORS = {
     "1617": "食品",
@@ -57,6 +65,67 @@ ACCESS_DELAY_MAX = 6.0
 # 定期実行間隔 (秒) ─ 余裕を持たせてレート制限回避
 LOOP_INTERVAL = 300  # 5分
 
+# 失敗した業種を同じサイクル内で再試行する回数
+# (既定は0: 再試行するとサイトへのアクセスが増えるため)
+SECTOR_RETRIES = 0
+
+# 並行して使うページ数 ─ 1業種の撮影中に次の業種の読み込みを始める
+PIPELINE_PAGES = 2
+
+# 画像のハッシュ計算・書き込み用スレッドプール (イベントループを止めない)
+WRITE_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="capture-writer")
+
+
+def setup_logging() -> QueueListener:
+    """ログ出力を別スレッドに任せる (イベントループ上でファイルI/Oをしない)
+
+    戻り値のリスナーは終了時に stop() して、残ったログを書き出すこと。
+    """
+    formatter = logging.Formatter(
+        "%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    file_handler = RotatingFileHandler(
+        LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+    )
+    console_handler = logging.StreamHandler()
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.handlers[:] = [QueueHandler(log_queue)]
+
+    listener = QueueListener(log_queue, file_handler, console_handler)
+    listener.start()
+    return listener
+
+
+class AccessGate:
+    """サイトへのアクセスを1業種ずつに制限し、業種間にランダムな間隔を空ける
+
+    ページ読み込み (遷移・タブ切り替え) はこのゲートの中だけで行うので、
+    ページを複数使ってもサイトへの同時アクセスやアクセス間隔は従来と変わらない。
+    ゲートを出た後の撮影・保存は次の業種の待機・読み込みと並行して進む。
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._ready_at = 0.0
+
+    @contextlib.asynccontextmanager
+    async def access(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            wait = self._ready_at - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                yield
+            finally:
+                self._ready_at = loop.time() + random.uniform(ACCESS_DELAY_MIN, ACCESS_DELAY_MAX)
+
 
 async def extract_price_data(page) -> dict:
     """ページから現在値・前日比データを抽出する"""
@@ -138,8 +207,8 @@ async def hide_non_chart_elements(page):
     """)
 
 
-async def take_chart_screenshot(page, save_path: Path):
-    """チャートエリアのスクリーンショットを撮影する"""
+async def take_chart_screenshot(page) -> tuple[bytes, str]:
+    """チャートエリアのスクリーンショットを撮影し、(PNGのバイト列, 使用したセレクタ) を返す"""
     # チャートのimg要素またはcanvasを探してスクリーンショット
     chart_element = None
     for selector in ['img[src*="chart"]', 'canvas', '.chart-area', '.chartArea', '#chartArea', '.chart img', '.chart-image']:
@@ -149,50 +218,91 @@ async def take_chart_screenshot(page, save_path: Path):
             break
 
     if chart_element and await chart_element.is_visible():
-        await chart_element.screenshot(path=str(save_path))
-    else:
-        # フォールバック: スクロールしてビューポートをスクリーンショット
-        await page.evaluate("window.scrollTo(0, 580)")
-        await asyncio.sleep(0.3)
-        await page.screenshot(path=str(save_path), full_page=False)
+        return await chart_element.screenshot(), selector
 
+    # フォールバック: スクロールしてビューポートをスクリーンショット
+    await page.evaluate("window.scrollTo(0, 580)")
+    await asyncio.sleep(0.3)
+    return await page.screenshot(full_page=False), "viewport"
 
-async def capture_chart(page, qcode: str, sector_name: str) -> dict | None:
-    """1業種のチャートを日足・日中足の2種類スクリーンショット撮影し、値動きデータを返す"""
-    url = BASE_URL.format(qcode=qcode)
-    intraday_path = SCREENSHOT_DIR / f"{qcode}_intraday.png"
-    daily_path = SCREENSHOT_DIR / f"{qcode}_daily.png"
 
-    try:
-        logger.info(f"[{qcode}] {sector_name} - アクセス中...")
-        await page.goto(url, wait_until="domcontentloaded", timeout=30000)
-        await page.wait_for_load_state("networkidle", timeout=30000)
+def store_and_publish(save_path: Path, data: bytes) -> bool:
+    """画像を保存し、書き込んだ場合は配信側に通知する (スレッドプールで実行)"""
+    # アーカイブに保存 (前回と同じ画像なら書き込まない)
+    written = screenshot_archive.store_capture(save_path, data)
+    if written:
+        publish()
+    return written
 
-        # 値動きデータを抽出
-        price_data = await extract_price_data(page)
 
-        # ── 1) 日足チャートをキャプチャ (デフォルト表示) ──
-        await hide_non_chart_elements(page)
-        await asyncio.sleep(random.uniform(0.5, 1.5))  # 人間らしい遅延
-        await take_chart_screenshot(page, daily_path)
+async def save_capture(save_path: Path, data: bytes):
+    """撮影した画像のハッシュ計算・保存・公開通知をスレッドプールで行う"""
+    loop = asyncio.get_running_loop()
+    written = await loop.run_in_executor(WRITE_POOL, store_and_publish, save_path, data)
+    if not written:
+        logger.info(f"{save_path.name} - 変化なしのため保存をスキップ")
 
-        # ── 2) 日中足チャートをキャプチャ ──
-        try:
-            intraday_tab = page.locator("text=日中足").first
-            await intraday_tab.click(timeout=5000)
-            await page.wait_for_load_state("networkidle", timeout=15000)
-            await asyncio.sleep(2)
-        except Exception:
-            await asyncio.sleep(1.5)
 
+async def capture_chart(
+    page,
+    qcode: str,
+    sector_name: str,
+    gate: AccessGate | None = None,
+    run: cycle_journal.SectorRun | None = None,
+) -> dict | None:
+    """1業種のチャートを日足・日中足の2種類スクリーンショット撮影し、値動きデータを返す
+
+    run を渡すと、所要時間・使用セレクタ・エラー内容を書き込む。
+    """
+    url = BASE_URL.format(qcode=qcode)
+    intraday_path = SCREENSHOT_DIR / f"{qcode}_intraday.png"
+    daily_path = SCREENSHOT_DIR / f"{qcode}_daily.png"
+    gate = gate or AccessGate()
+    run = run or cycle_journal.SectorRun(qcode)
+    saves = []
+
+    try:
+        async with gate.access():
+            logger.info(f"[{qcode}] {sector_name} - アクセス中...")
+            start = time.monotonic()
+            await page.goto(url, wait_until="domcontentloaded", timeout=30000)
+            await page.wait_for_load_state("networkidle", timeout=30000)
+
+            # 値動きデータを抽出
+            price_data = await extract_price_data(page)
+
+            # ── 1) 日足チャートをキャプチャ (デフォルト表示) ──
+            await hide_non_chart_elements(page)
+            await asyncio.sleep(random.uniform(0.5, 1.5))  # 人間らしい遅延
+            daily_png, run.daily_selector = await take_chart_screenshot(page)
+            saves.append(asyncio.create_task(save_capture(daily_path, daily_png)))
+
+            # ── 2) 日中足チャートに切り替え ──
+            tab_loaded = False
+            try:
+                intraday_tab = page.locator("text=日中足").first
+                await intraday_tab.click(timeout=5000)
+                await page.wait_for_load_state("networkidle", timeout=15000)
+                tab_loaded = True
+            except Exception:
+                pass
+
+        # ここから先はサイトにアクセスしないので、次の業種と並行して進める
+        await asyncio.sleep(2 if tab_loaded else 1.5)
         await hide_non_chart_elements(page)
         await asyncio.sleep(random.uniform(0.5, 1.5))  # 人間らしい遅延
-        await take_chart_screenshot(page, intraday_path)
+        intraday_png, run.intraday_selector = await take_chart_screenshot(page)
+        saves.append(asyncio.create_task(save_capture(intraday_path, intraday_png)))
 
+        await asyncio.gather(*saves)
+        run.latency = time.monotonic() - start
         logger.info(f"[{qcode}] {sector_name} - 保存完了 | {price_data.get('change', '')} {price_data.get('changePercent', '')}")
         return price_data
 
     except Exception as e:
+        # 途中で失敗しても撮影済みの画像は保存しきる
+        await asyncio.gather(*saves, return_exceptions=True)
+        run.error = str(e)
         logger.error(f"[{qcode}] {sector_name} - エラー: {e}")
         return None
 
@@ -245,31 +355,52 @@ def save_price_data(all_price_data: dict):
         json.dump(current_data, f, ensure_ascii=False, indent=2)
 
 
-async def scrape_all_sectors():
-    """全17業種のチャートをスクレイピングする (1サイクル)"""
+def publish():
+    """スクリーンショットの更新を配信側 (app.py) に通知する"""
+    screenshot_cache.mark_published(SCREENSHOT_DIR)
+
+
+async def scrape_all_sectors(record: cycle_journal.CycleRecord | None = None):
+    """全17業種のチャートをスクレイピングする (1サイクル)
+
+    record を渡すと、業種ごとの結果を追記する。
+    """
     SCREENSHOT_DIR.mkdir(exist_ok=True)
+    record = record or cycle_journal.CycleRecord()
 
     async with async_playwright() as p:
         browser, context = await create_browser_context(p)
-        page = await context.new_page()
+        pages = [await context.new_page() for _ in range(PIPELINE_PAGES)]
+        gate = AccessGate()
 
-        success_count = 0
         total = len(SECTORS)
-        all_price_data = {}
-
-        for i, (qcode, name) in enumerate(SECTORS.items()):
-            price_data = await capture_chart(page, qcode, name)
-            if price_data is not None:
-                success_count += 1
-                all_price_data[qcode] = price_data
-
-            if i < total - 1:
-                delay = random.uniform(ACCESS_DELAY_MIN, ACCESS_DELAY_MAX)
-                await asyncio.sleep(delay)
-
+        results = {}
+        runs = {}
+        pending = iter(SECTORS.items())
+
+        async def worker(page):
+            # 各ページが空いたら次の業種を取りに行く (アクセス順はゲートで直列化)
+            for qcode, name in pending:
+                for attempt in range(SECTOR_RETRIES + 1):
+                    # 試行ごとに記録を作り直し、前回の失敗の値を持ち越さない
+                    run = runs[qcode] = cycle_journal.SectorRun(qcode, retries=attempt)
+                    results[qcode] = await capture_chart(page, qcode, name, gate, run)
+                    if results[qcode] is not None:
+                        run.ok = True
+                        break
+
+        await asyncio.gather(*(worker(page) for page in pages))
         await browser.close()
 
-    save_price_data(all_price_data)
+    # 業種コード順に並べ直す
+    all_price_data = {
+        qcode: results[qcode] for qcode in SECTORS if results.get(qcode) is not None
+    }
+    record.sectors.extend(runs[qcode] for qcode in SECTORS if qcode in runs)
+    success_count = len(all_price_data)
+
+    await asyncio.to_thread(save_price_data, all_price_data)
+    await asyncio.to_thread(publish)
     logger.info(f"スクレイピング完了: {success_count}/{total} 業種成功")
     return success_count
 
@@ -343,13 +474,30 @@ async def wait_until_market_open():
 async def run_loop():
     """5分間隔で定期実行するメインループ"""
     logger.info("=== TOPIX-17業種 ETFチャート スクレイパー 起動 ===")
+    last_compacted = None
     while True:
         await wait_until_market_open()  # 営業時間チェック＆待機
         start = time.time()
-        await scrape_all_sectors()
+        record = cycle_journal.CycleRecord()
+        await scrape_all_sectors(record)
         elapsed = time.time() - start
         logger.info(f"1サイクル完了 ({elapsed:.1f}秒)")
 
+        # 実行記録を保存 (書き込みはスレッドで行う)
+        record.ended_at = cycle_journal.now_iso()
+        record.duration = elapsed
+        try:
+            await asyncio.to_thread(cycle_journal.write_cycle, record)
+        except Exception as e:
+            logger.warning(f"実行記録の保存失敗: {e}")
+
+        # アーカイブの間引きは1日1回
+        today = datetime.date.today()
+        if last_compacted != today:
+            removed_frames, removed_objects = await asyncio.to_thread(screenshot_archive.compact)
+            logger.info(f"アーカイブ整理: {removed_frames}フレーム / {removed_objects}画像を削除")
+            last_compacted = today
+
         wait_time = max(0, LOOP_INTERVAL - elapsed)
         if wait_time > 0:
             logger.info(f"次の更新まで {wait_time:.0f}秒 待機...")
@@ -365,13 +513,18 @@ async def test_single():
         page = await context.new_page()
         price_data = await capture_chart(page, "1617", "食品")
         if price_data:
-            save_price_data({"1617": price_data})
+            await asyncio.to_thread(save_price_data, {"1617": price_data})
+            await asyncio.to_thread(publish)
             logger.info(f"テスト結果: {json.dumps(price_data, ensure_ascii=False)}")
         await browser.close()
 
 
 if __name__ == "__main__":
-    if "--test" in sys.argv:
-        asyncio.run(test_single())
-    else:
-        asyncio.run(run_loop())
+    listener = setup_logging()
+    try:
+        if "--test" in sys.argv:
+            asyncio.run(test_single())
+        else:
+            asyncio.run(run_loop())
+    finally:
+        listener.stop()
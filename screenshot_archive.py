@@ -0,0 +1,143 @@
+"""
+TOPIX-17業種 ETFチャート監視モニター - スクリーンショット履歴アーカイブ
+撮影した画像を内容のハッシュで保存し、チャートごとのタイムラインを記録する。
+同じ画像が続いた場合は書き込みを行わない。
+
+    archive/objects/ab/abcdef....png    画像本体 (SHA-1 をファイル名に使用)
+    archive/timeline/1617_intraday.jsonl  {"ts": ..., "hash": ...} を1行ずつ追記
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+ARCHIVE_DIR = Path(__file__).parent / "archive"
+OBJECTS_DIR = ARCHIVE_DIR / "objects"
+TIMELINE_DIR = ARCHIVE_DIR / "timeline"
+
+# 保持ポリシー: 当日は全フレーム、この日数までは1時間ごと、それ以前は1日ごと
+HOURLY_RETENTION_DAYS = 7
+
+# タイムラインごとの最新ハッシュ (重複判定用)
+_last_hashes: dict[str, str | None] = {}
+
+
+def atomic_write(path: Path, data: bytes):
+    """一時ファイルに書いてから置き換え、読み手に書きかけを見せない"""
+    tmp = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def object_path(digest: str) -> Path:
+    return OBJECTS_DIR / digest[:2] / f"{digest}.png"
+
+
+def timeline_path(key: str) -> Path:
+    return TIMELINE_DIR / f"{key}.jsonl"
+
+
+def load_timeline(key: str) -> list[dict]:
+    """タイムライン (古い順) を読み込む"""
+    path = timeline_path(key)
+    if not path.exists():
+        return []
+    frames = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                frames.append(json.loads(line))
+    return frames
+
+
+def last_hash(key: str) -> str | None:
+    if key not in _last_hashes:
+        frames = load_timeline(key)
+        _last_hashes[key] = frames[-1]["hash"] if frames else None
+    return _last_hashes[key]
+
+
+def store_capture(save_path: Path, data: bytes, now: datetime.datetime | None = None) -> bool:
+    """撮影した画像を公開パスとアーカイブに保存する
+
+    直前のフレームと内容が同じ場合は何も書き込まずに False を返す。
+    """
+    key = save_path.stem
+    digest = hashlib.sha1(data).hexdigest()
+    if digest == last_hash(key) and save_path.exists():
+        return False
+
+    obj = object_path(digest)
+    if not obj.exists():
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(obj, data)
+
+    TIMELINE_DIR.mkdir(parents=True, exist_ok=True)
+    ts = (now or datetime.datetime.now()).isoformat(timespec="seconds")
+    with open(timeline_path(key), "a", encoding="utf-8") as f:
+        f.write(json.dumps({"ts": ts, "hash": digest}) + "\n")
+    _last_hashes[key] = digest
+
+    atomic_write(save_path, data)
+    return True
+
+
+def frames_for_date(key: str, date: datetime.date) -> list[dict]:
+    """指定日のフレーム一覧を返す"""
+    prefix = date.isoformat()
+    return [f for f in load_timeline(key) if f["ts"].startswith(prefix)]
+
+
+def _retention_bucket(ts: datetime.datetime, now: datetime.datetime) -> str | None:
+    """同じバケットのフレームは最初の1枚だけ残す (None は全て残す)"""
+    if ts.date() == now.date():
+        return None
+    if now - ts <= datetime.timedelta(days=HOURLY_RETENTION_DAYS):
+        return ts.strftime("%Y-%m-%dT%H")
+    return ts.strftime("%Y-%m-%d")
+
+
+def compact(now: datetime.datetime | None = None) -> tuple[int, int]:
+    """保持ポリシーに従ってタイムラインを間引き、参照されなくなった画像を削除する
+
+    (削除したフレーム数, 削除した画像数) を返す。
+    """
+    now = now or datetime.datetime.now()
+    removed_frames = 0
+    referenced = set()
+
+    if TIMELINE_DIR.exists():
+        for path in TIMELINE_DIR.glob("*.jsonl"):
+            frames = load_timeline(path.stem)
+            kept = []
+            seen_buckets = set()
+            for frame in frames:
+                bucket = _retention_bucket(datetime.datetime.fromisoformat(frame["ts"]), now)
+                if bucket is not None:
+                    if bucket in seen_buckets:
+                        continue
+                    seen_buckets.add(bucket)
+                kept.append(frame)
+            # 最新フレームは重複判定に使うので必ず残す
+            if frames and frames[-1] not in kept:
+                kept.append(frames[-1])
+
+            removed_frames += len(frames) - len(kept)
+            if len(kept) != len(frames):
+                body = "".join(json.dumps(f) + "\n" for f in kept)
+                atomic_write(path, body.encode("utf-8"))
+            referenced.update(f["hash"] for f in kept)
+
+    removed_objects = 0
+    if OBJECTS_DIR.exists():
+        for obj in OBJECTS_DIR.glob("*/*.png"):
+            if obj.stem not in referenced:
+                obj.unlink()
+                removed_objects += 1
+
+    return removed_frames, removed_objects
@@ -0,0 +1,130 @@
+"""
+TOPIX-17業種 ETFチャート監視モニター - 配信用インメモリキャッシュ
+スクレイパーが公開マーカーを更新したときだけディスクを読み直し、
+それ以外のリクエストはメモリ上のバイト列から応答する。
+"""
+
+import gzip
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+# スクレイパーが更新のたびに touch するファイル (mark_published を参照)
+PUBLISH_MARKER = ".published"
+
+# 公開マーカーが更新されなくても、この間隔 (秒) で一度はファイルを確認し直す
+# (マーカーを更新しない書き込みや手動で戻したファイルへの対策)
+FULL_RESCAN_INTERVAL = 30.0
+
+# キャッシュ対象のファイル
+CACHED_PATTERNS = ("*.png", "price_data.json")
+
+# 圧縮して効果のある形式だけ gzip 版を保持する (PNG は圧縮済み)
+COMPRESSIBLE_SUFFIXES = {".json"}
+
+MIMETYPES = {
+    ".png": "image/png",
+    ".json": "application/json",
+}
+
+
+def mark_published(directory: Path):
+    """スクリーンショットの更新を配信側のキャッシュに通知する"""
+    (directory / PUBLISH_MARKER).touch()
+
+
+@dataclass(frozen=True)
+class CachedFile:
+    """メモリ上に保持した1ファイル分の配信データ"""
+    data: bytes
+    gzip_data: bytes | None
+    etag: str
+    mtime: float
+    mimetype: str
+    stat_key: tuple[int, int]
+
+
+class ScreenshotCache:
+    """スクリーンショットディレクトリのインメモリキャッシュ
+
+    公開マーカーの更新時刻を最大 check_interval 秒に1回だけ確認し、
+    変化があったとき (またはマーカーに関係なく rescan_interval 秒ごと) に
+    (mtime_ns, size) が変わったファイルだけを読み直す。
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        check_interval: float = 1.0,
+        rescan_interval: float = FULL_RESCAN_INTERVAL,
+    ):
+        self.directory = directory
+        self.check_interval = check_interval
+        self.rescan_interval = rescan_interval
+        self._entries: dict[str, CachedFile] = {}
+        self._lock = threading.Lock()
+        self._marker_mtime_ns: int | None = None
+        self._last_check = float("-inf")
+        self._last_rescan = float("-inf")
+
+    def _read_marker(self) -> int:
+        try:
+            return (self.directory / PUBLISH_MARKER).stat().st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def refresh_if_published(self):
+        """公開マーカーが更新されていればキャッシュを読み直す"""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            if now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+            marker = self._read_marker()
+            if marker == self._marker_mtime_ns and now - self._last_rescan < self.rescan_interval:
+                return
+            self._reload()
+            self._marker_mtime_ns = marker
+            self._last_rescan = now
+
+    def _reload(self):
+        """変更のあったファイルだけを読み直し、辞書ごと差し替える"""
+        entries = {}
+        if self.directory.exists():
+            paths = {p for pattern in CACHED_PATTERNS for p in self.directory.glob(pattern)}
+            for path in paths:
+                try:
+                    st = path.stat()
+                    stat_key = (st.st_mtime_ns, st.st_size)
+                    current = self._entries.get(path.name)
+                    if current and current.stat_key == stat_key:
+                        entries[path.name] = current
+                        continue
+                    data = path.read_bytes()
+                except FileNotFoundError:
+                    continue
+                gzip_data = None
+                if path.suffix in COMPRESSIBLE_SUFFIXES:
+                    gzip_data = gzip.compress(data, mtime=0)
+                entries[path.name] = CachedFile(
+                    data=data,
+                    gzip_data=gzip_data,
+                    etag=hashlib.sha1(data).hexdigest()[:16],
+                    mtime=st.st_mtime,
+                    mimetype=MIMETYPES.get(path.suffix, "application/octet-stream"),
+                    stat_key=stat_key,
+                )
+        self._entries = entries
+
+    def get(self, filename: str) -> CachedFile | None:
+        return self._entries.get(filename)
+
+    def entries(self) -> dict[str, CachedFile]:
+        return self._entries
+
+    def latest_png_mtime(self) -> float:
+        return max((e.mtime for name, e in self._entries.items() if name.endswith(".png")), default=0)
@@ -4,10 +4,8 @@ TOPIX-17業種 ETFチャート監視モニター - Streamlit版
 """
 
 import json
-import time
 from pathlib import Path
 from datetime import datetime
-from PIL import Image
 
 import streamlit as st
 
@@ -44,6 +42,8 @@ SCREENSHOT_DIR = Path(__file__).parent / "screenshots"
 PRICE_DATA_FILE = SCREENSHOT_DIR / "price_data.json"
 COLS_PER_ROW = 3
 AUTO_REFRESH_SEC = 300  # 5分
+# 画像キャッシュの上限 (業種数 × モード2種 × 新旧2世代)
+IMAGE_CACHE_SIZE = len(SECTORS) * 2 * 2
 
 
 # ── カスタムCSS ───────────────────────────────────────
@@ -185,6 +185,19 @@ def load_price_data() -> dict:
     return {}
 
 
+@st.cache_resource(max_entries=IMAGE_CACHE_SIZE, show_spinner=False)
+def load_chart_image(path: str, mtime_ns: int) -> bytes:
+    """チャート画像のPNGバイト列を返す
+
+    (パス, 更新時刻) をキーに全セッション共通でキャッシュするため、
+    ファイルが書き換えられた画像だけが読み直される。
+    バイト列のまま st.image に渡すので再エンコードも発生しない。
+    上限を超えた分は古いものから破棄される。
+    """
+    with open(path, "rb") as f:
+        return f.read()
+
+
 def get_last_update() -> str:
     """最新のスクリーンショットの更新時刻を取得"""
     latest = 0
@@ -198,66 +211,29 @@ def get_last_update() -> str:
     return "--:--:--"
 
 
-# ── メイン ────────────────────────────────────────────
-def main():
-    inject_css()
-
-    # ── ヘッダー ──
-    # レイアウト調整: 中央を広げる [3, 4, 3]
-    h_left, h_center, h_right = st.columns([3, 4, 3])
-    with h_left:
-        st.markdown("""
-        <div style="display:flex; align-items:center; gap:12px;">
-            <div class="dashboard-header">
-                <div style="display:flex; align-items:center;">
-                    <span class="logo">17</span>
-                    <div>
-                        <div class="title">TOPIX-17業種 ETFチャート監視モニター</div>
-                    </div>
-                </div>
+# ── 部分更新 (fragment) ───────────────────────────────
+@st.fragment(run_every=AUTO_REFRESH_SEC)
+def render_status():
+    """ヘッダー右側の監視ステータスと最終更新時刻を描画する"""
+    last_update = get_last_update()
+    st.markdown(f"""
+    <div style="display:flex; align-items:center; justify-content:flex-end; gap:16px; padding-top:8px;">
+        <div class="dashboard-header">
+            <div class="status">
+                <div class="status-dot"></div>
+                <span>監視中</span>
             </div>
         </div>
-        """, unsafe_allow_html=True)
-
-    with h_center:
-        # チャートモードと並び順を横並びにする
-        c_mode, c_sort = st.columns(2)
-        with c_mode:
-            mode = st.radio(
-                "チャートモード",
-                ["5分足", "日足"],
-                horizontal=True,
-                key="chart_mode",
-            )
-        with c_sort:
-            sort_order = st.radio(
-                "並び順",
-                ["コード順", "上昇率順", "下落率順"],
-                horizontal=True,
-                key="sort_order",
-            )
-
-    with h_right:
-        last_update = get_last_update()
-        st.markdown(f"""
-        <div style="display:flex; align-items:center; justify-content:flex-end; gap:16px; padding-top:8px;">
-            <div class="dashboard-header">
-                <div class="status">
-                    <div class="status-dot"></div>
-                    <span>監視中</span>
-                </div>
-            </div>
-            <div style="font-size:12px; color:#55556a;">
-                最終更新: {last_update}
-            </div>
+        <div style="font-size:12px; color:#55556a;">
+            最終更新: {last_update}
         </div>
-        """, unsafe_allow_html=True)
-
-    st.markdown("<div style='height:4px'></div>", unsafe_allow_html=True)
+    </div>
+    """, unsafe_allow_html=True)
 
-    # ── チャート表示用suffix ──
-    suffix = "_intraday" if mode == "5分足" else "_daily"
 
+@st.fragment(run_every=AUTO_REFRESH_SEC)
+def render_grid(suffix: str, sort_order: str):
+    """カードグリッドを描画する (一定間隔でこの部分だけ再実行される)"""
     # ── 値動きデータ ──
     price_data = load_price_data()
 
@@ -307,18 +283,73 @@ def main():
                     unsafe_allow_html=True,
                 )
 
-                # チャート画像
+                # チャート画像 (更新時刻が変わったものだけ読み直す)
                 img_path = SCREENSHOT_DIR / f"{qcode}{suffix}.png"
-                
-                if img_path.exists():
-                    try:
-                        image = Image.open(img_path)
-                        st.image(image)
-                    except Exception as e:
-                        st.error(f"画像読み込みエラー: {e}")
-                else:
+
+                try:
+                    mtime_ns = img_path.stat().st_mtime_ns
+                except FileNotFoundError:
                     # デバッグ表示
                     st.warning(f"画像未検出: {img_path.name}")
+                    continue
+
+                try:
+                    image = load_chart_image(str(img_path), mtime_ns)
+                    st.image(image)
+                except Exception as e:
+                    st.error(f"画像読み込みエラー: {e}")
+
+
+# ── メイン ────────────────────────────────────────────
+def main():
+    inject_css()
+
+    # ── ヘッダー ──
+    # レイアウト調整: 中央を広げる [3, 4, 3]
+    h_left, h_center, h_right = st.columns([3, 4, 3])
+    with h_left:
+        st.markdown("""
+        <div style="display:flex; align-items:center; gap:12px;">
+            <div class="dashboard-header">
+                <div style="display:flex; align-items:center;">
+                    <span class="logo">17</span>
+                    <div>
+                        <div class="title">TOPIX-17業種 ETFチャート監視モニター</div>
+                    </div>
+                </div>
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+
+    with h_center:
+        # チャートモードと並び順を横並びにする
+        c_mode, c_sort = st.columns(2)
+        with c_mode:
+            mode = st.radio(
+                "チャートモード",
+                ["5分足", "日足"],
+                horizontal=True,
+                key="chart_mode",
+            )
+        with c_sort:
+            sort_order = st.radio(
+                "並び順",
+                ["コード順", "上昇率順", "下落率順"],
+                horizontal=True,
+                key="sort_order",
+            )
+
+    with h_right:
+        render_status()
+
+    st.markdown("<div style='height:4px'></div>", unsafe_allow_html=True)
+
+    # ── チャート表示用suffix ──
+    suffix = "_intraday" if mode == "5分足" else "_daily"
+
+    # ── グリッド表示 ──
+    # 自動更新はこのfragmentだけを再実行する (ページ全体は再実行しない)
+    render_grid(suffix, sort_order)
 
     # ── デバッグ用情報を下部に表示 ──
     with st.expander("デバッグ情報 (管理者用)"):
@@ -339,10 +370,6 @@ def main():
         unsafe_allow_html=True,
     )
 
-    # 5分後に自動リフレッシュ
-    time.sleep(AUTO_REFRESH_SEC)
-    st.rerun()
-
 
 if __name__ == "__main__":
     main()